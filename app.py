@@ -1,8 +1,23 @@
+import os
+
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 
+# Use pandas' numba groupby engine when available: one fused JIT kernel sums all
+# value columns in a single pass over the table instead of one Cython pass each.
+try:
+    import numba  # noqa: F401
+    GROUPBY_ENGINE = {"engine": "numba", "engine_kwargs": {"parallel": True}}
+except ImportError:
+    GROUPBY_ENGINE = {}
+
+# Shared slimmed-down chart chrome: tight margins, no default template bloat, and
+# a stable uirevision so the client keeps zoom/pan state instead of re-laying out
+TRIM_LAYOUT = dict(margin=dict(l=40, r=10, t=40, b=30), template=None, uirevision="keep")
+PLOTLY_CONFIG = {"displayModeBar": False}
+
 # Must be the first Streamlit command
 st.set_page_config(layout="wide", page_title="Demo Service Company Dashboard")
 
@@ -13,90 +28,203 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Try to import data.py, with fallback if it fails
+# Try to load data via the cached loaders, with fallback if it fails
 try:
-    from data import attribution_data, orders_data, pricing_sent_data
+    from data import load_attribution, load_orders, load_pricing_sent, safe_ratio
+    attribution_data = load_attribution()
+    orders_data = load_orders()
+    pricing_sent_data = load_pricing_sent()
 except Exception as e:
-    st.error(f"Error importing data.py: {e}")
+    st.error(f"Error loading data: {e}")
     attribution_data = pd.DataFrame()
     orders_data = pd.DataFrame()
     pricing_sent_data = pd.DataFrame()
 
-# Helper function for table formatting
+# Helper to list the YearMonth display strings in chronological order
+def sorted_months(df):
+    return (df[["YearMonthPeriod", "YearMonth"]]
+            .drop_duplicates()
+            .sort_values("YearMonthPeriod")["YearMonth"].tolist())
+
+# Helper function for table formatting. Returns a Styler so the underlying
+# columns stay numeric and formatting only happens at render time.
+TABLE_FORMATS = {
+    "Total Job Amount": "${:,.0f}",
+    "Campaign Cost": "${:,.0f}",
+    "Cost per Lead": "${:,.0f}",
+    "Order Total": "${:,.0f}",
+    # These go float64 when a left-merge leaves NaN-filled months; format them
+    # as whole numbers so the Styler never falls back to six-decimal floats
+    "Pricing Sent": "{:,.0f}",
+    "Total Orders": "{:,.0f}",
+    "Conversion Rate": "{:.0%}",
+    "Booking Rate": "{:.0%}",
+    "ROI": "{:.0%}",
+}
+
 def format_table_data(df):
     if df.empty:
         return df
     df = df.copy()
-    for col in ["Total Job Amount", "Campaign Cost", "Cost per Lead", "Order Total"]:
-        if col in df.columns:
-            df[col] = df[col].apply(lambda x: f"${int(x):,}")
-    for col in ["Conversion Rate", "Booking Rate"]:
-        if col in df.columns:
-            df[col] = df[col].apply(lambda x: f"{int(x * 100)}%")
-    if "ROI" in df.columns:
-        df["ROI"] = df["ROI_numeric"].apply(lambda x: f"{int(x * 100)}%")
-    return df
+    if "YearMonthPeriod" in df.columns:
+        df = df.drop(columns=["YearMonthPeriod"])
+    df = df.rename(columns={"ROI_numeric": "ROI"})
+    return df.style.format({col: fmt for col, fmt in TABLE_FORMATS.items() if col in df.columns})
+
+# Month-keyed aggregates over the full dataset. The grouping key never changes
+# between reruns, so compute these once and let prepare_data slice the small results.
+@st.cache_data(ttl=3600)
+def monthly_sums(attr, orders):
+    attr_monthly = attr.groupby("YearMonthPeriod", observed=True, sort=False)[["Inquiries", "Orders", "Campaign Cost", "Total Job Amount"]].sum(**GROUPBY_ENGINE)
+    # One pass over orders for both the revenue sum and the order count
+    orders_monthly = orders.groupby("YearMonthPeriod", observed=True, sort=False).agg(
+        **{"Order Total": ("Order Total", "sum"), "Total Orders": ("Order Total", "size")})
+    return attr_monthly, orders_monthly
+
+@st.cache_data(ttl=3600)
+def source_monthly_sums(attr, agg_key):
+    return attr.groupby([agg_key, "YearMonthPeriod"], observed=True, sort=False)[["Inquiries", "Pricing Sent", "Orders", "Paid Orders",
+                                                                                  "Total Job Amount", "Campaign Cost"]].sum(**GROUPBY_ENGINE).reset_index()
 
 # Prepare data with debug checks
 def prepare_data(start_month, end_month, aggregation_type):
-    st.write("Preparing data...")
+    debug = st.session_state.get("debug")
+    if debug:
+        st.write("Preparing data...")
     if attribution_data.empty:
         st.warning("Attribution data is empty!")
         return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
-    all_months = sorted(attribution_data["YearMonth"].unique(), 
-                        key=lambda x: pd.to_datetime(x, format="%b. %Y", errors="coerce"))
-    st.write(f"All months: {all_months}")
+    month_lookup = (attribution_data[["YearMonthPeriod", "YearMonth"]]
+                    .drop_duplicates().sort_values("YearMonthPeriod"))
+    all_months = month_lookup["YearMonth"].tolist()
+    if debug:
+        st.write(f"All months: {all_months}")
     start_idx = all_months.index(start_month)
     end_idx = all_months.index(end_month)
     selected_months = all_months[start_idx:end_idx + 1]
-    st.write(f"Selected months: {selected_months}")
+    # Contiguous month range: two vectorized compares on the Period ordinals
+    # beat a per-row hash-set .isin lookup
+    period_list = month_lookup["YearMonthPeriod"].tolist()
+    start_period, end_period = period_list[start_idx], period_list[end_idx]
+    if debug:
+        st.write(f"Selected months: {selected_months}")
 
-    # Filter Attribution Data
-    filtered_attr = attribution_data[attribution_data["YearMonth"].isin(selected_months)]
-    st.write(f"Filtered attribution data shape: {filtered_attr.shape}")
+    # Slice the cached per-month sums instead of re-grouping the full table
     agg_key = "Source" if aggregation_type == "source" else "Display Source"
-    agg_data = filtered_attr.groupby(agg_key)[["Inquiries", "Pricing Sent", "Orders", "Paid Orders", 
-                                               "Total Job Amount", "Campaign Cost"]].sum().reset_index()
-    agg_data["Cost per Lead"] = (agg_data["Campaign Cost"] / agg_data["Inquiries"]).fillna(0).round(0)
-    agg_data["Conversion Rate"] = (agg_data["Orders"] / agg_data["Pricing Sent"]).fillna(0).round(2)
-    agg_data["Booking Rate"] = (agg_data["Pricing Sent"] / agg_data["Inquiries"]).fillna(0).round(2)
-    agg_data["ROI_numeric"] = ((agg_data["Total Job Amount"] - agg_data["Campaign Cost"]) / 
-                               agg_data["Campaign Cost"]).fillna(0).round(2)
-    agg_data["ROI"] = agg_data["ROI_numeric"].apply(lambda x: f"{int(x * 100)}%")
+    source_sums = source_monthly_sums(attribution_data, agg_key)
+    agg_data = (source_sums[(source_sums["YearMonthPeriod"] >= start_period) &
+                            (source_sums["YearMonthPeriod"] <= end_period)]
+                .groupby(agg_key, observed=True, sort=False)[["Inquiries", "Pricing Sent", "Orders", "Paid Orders",
+                                                              "Total Job Amount", "Campaign Cost"]].sum().reset_index())
+    agg_data["Cost per Lead"] = safe_ratio(agg_data["Campaign Cost"], agg_data["Inquiries"], 0)
+    agg_data["Conversion Rate"] = safe_ratio(agg_data["Orders"], agg_data["Pricing Sent"], 2)
+    agg_data["Booking Rate"] = safe_ratio(agg_data["Pricing Sent"], agg_data["Inquiries"], 2)
+    agg_data["ROI_numeric"] = safe_ratio(agg_data["Total Job Amount"] - agg_data["Campaign Cost"],
+                                         agg_data["Campaign Cost"], 2)
     agg_data["Month"] = f"{start_month} - {end_month}" if start_month != end_month else start_month
     agg_data["Display Source"] = agg_data[agg_key]
 
     # Monthly Data
-    monthly_agg = filtered_attr.groupby("YearMonth")[["Inquiries", "Orders", "Campaign Cost", "Total Job Amount"]].sum().reset_index()
+    attr_monthly, orders_monthly = monthly_sums(attribution_data, orders_data)
+    monthly_agg = attr_monthly[(attr_monthly.index >= start_period) & (attr_monthly.index <= end_period)].reset_index()
     monthly_agg = monthly_agg.rename(columns={"Orders": "New Orders"})
-    monthly_agg = monthly_agg.merge(pricing_sent_data, on="YearMonth", how="left")
+    monthly_agg = monthly_agg.merge(pricing_sent_data[["YearMonthPeriod", "Pricing Sent"]], on="YearMonthPeriod", how="left")
     monthly_agg["Pricing Sent"] = monthly_agg["Pricing Sent"].fillna(0).round(0)
-    monthly_agg = monthly_agg.merge(orders_data.groupby("YearMonth")["Order Total"].sum().reset_index(), on="YearMonth", how="left")
+    monthly_agg = monthly_agg.merge(orders_monthly.reset_index(), on="YearMonthPeriod", how="left")
     monthly_agg["Order Total"] = monthly_agg["Order Total"].fillna(0).round(0)
-    monthly_agg["Total Orders"] = orders_data.groupby("YearMonth").size().reindex(monthly_agg["YearMonth"], fill_value=0).values
-    monthly_agg["Cost per Lead"] = (monthly_agg["Campaign Cost"] / monthly_agg["Inquiries"]).fillna(0).round(0)
-    monthly_agg["Conversion Rate"] = (monthly_agg["New Orders"] / monthly_agg["Pricing Sent"]).fillna(0).round(2)
-    monthly_agg["Booking Rate"] = (monthly_agg["Pricing Sent"] / monthly_agg["Inquiries"]).fillna(0).round(2)
-    monthly_agg["ROI_numeric"] = ((monthly_agg["Total Job Amount"] - monthly_agg["Campaign Cost"]) / 
-                                  monthly_agg["Campaign Cost"]).fillna(0).round(2)
-    monthly_agg["ROI"] = monthly_agg["ROI_numeric"].apply(lambda x: f"{int(x * 100)}%")
-    
-    # Fix the sorting logic for YearMonth
-    def parse_date(date_str):
-        try:
-            return pd.to_datetime(date_str, format="%b. %Y")
-        except:
-            return pd.to_datetime(date_str, format="mixed")
-    
-    monthly_agg = monthly_agg.sort_values("YearMonth", key=lambda x: x.apply(parse_date))
+    monthly_agg["Total Orders"] = monthly_agg["Total Orders"].fillna(0)
+    monthly_agg["Cost per Lead"] = safe_ratio(monthly_agg["Campaign Cost"], monthly_agg["Inquiries"], 0)
+    monthly_agg["Conversion Rate"] = safe_ratio(monthly_agg["New Orders"], monthly_agg["Pricing Sent"], 2)
+    monthly_agg["Booking Rate"] = safe_ratio(monthly_agg["Pricing Sent"], monthly_agg["Inquiries"], 2)
+    monthly_agg["ROI_numeric"] = safe_ratio(monthly_agg["Total Job Amount"] - monthly_agg["Campaign Cost"],
+                                            monthly_agg["Campaign Cost"], 2)
+
+    # Sort on the Period column, no string re-parsing needed
+    monthly_agg = monthly_agg.sort_values("YearMonthPeriod")
+    monthly_agg.insert(0, "YearMonth", monthly_agg["YearMonthPeriod"].dt.strftime("%b. %Y"))
 
     # Revenue Data
-    filtered_orders = orders_data[orders_data["YearMonth"].isin(selected_months)]
-    revenue_by_yearmonth = filtered_orders.groupby("YearMonth")["Order Total"].sum().reset_index()
+    revenue_by_yearmonth = (orders_monthly.loc[(orders_monthly.index >= start_period) &
+                                               (orders_monthly.index <= end_period), ["Order Total"]]
+                            .reset_index().sort_values("YearMonthPeriod"))
+    revenue_by_yearmonth["YearMonth"] = revenue_by_yearmonth["YearMonthPeriod"].dt.strftime("%b. %Y")
 
     return agg_data, monthly_agg, revenue_by_yearmonth
 
+# Figure builders are cached on their (small) input frames so unchanged widget
+# combinations reuse the built Figure instead of reconstructing and re-serializing it
+@st.cache_data
+def make_trend_fig(rev_df):
+    # No per-point text labels: hover shows the values and the labels double
+    # the trace payload and force layout recalculation
+    fig_trend = go.Figure(data=[go.Scatter(
+        x=rev_df["YearMonth"],
+        y=rev_df["Order Total"],
+        mode='lines+markers',
+    )])
+    fig_trend.update_layout(
+        **TRIM_LAYOUT,
+        title="Monthly Revenue Trend",
+        height=400,
+        showlegend=False,
+        yaxis_title="Revenue ($)",
+        yaxis=dict(tickformat="$,.0f"),
+        xaxis_title="Month"
+    )
+    return fig_trend
+
+@st.cache_data
+def make_sources_fig(agg_df):
+    fig_sources = go.Figure(data=[go.Pie(
+        labels=agg_df["Display Source"],
+        values=agg_df["Inquiries"],
+        hole=.3,
+        textinfo='label+percent+value',
+        marker=dict(colors=px.colors.qualitative.Set3)
+    )])
+    fig_sources.update_layout(
+        **TRIM_LAYOUT,
+        title="Inquiries by Source/Campaign",
+        height=400,
+        showlegend=False
+    )
+    return fig_sources
+
+@st.cache_data
+def make_funnel_fig(agg_df):
+    # Calculate total values for each stage
+    total_inquiries = agg_df["Inquiries"].sum()
+    total_pricing = agg_df["Pricing Sent"].sum()
+    total_orders = agg_df["Orders"].sum()
+    total_paid = agg_df["Paid Orders"].sum()
+
+    # Create the funnel data
+    stages = ["Inquiries", "Pricing Sent", "Orders", "Paid Orders"]
+    values = [total_inquiries, total_pricing, total_orders, total_paid]
+
+    # Calculate percentages
+    percentages = [(v / total_inquiries * 100).round(1) for v in values]
+
+    fig_funnel = go.Figure(go.Bar(
+        x=values,
+        y=stages,
+        orientation='h',
+        text=[f"{v:,} ({p}%)" for v, p in zip(values, percentages)],
+        textposition='auto',
+        marker_color=px.colors.qualitative.Set3[0]
+    ))
+    fig_funnel.update_layout(
+        **TRIM_LAYOUT,
+        title="Marketing Funnel Progression",
+        height=400,
+        showlegend=False,
+        xaxis_title="Count",
+        yaxis_title="Stage",
+        xaxis=dict(tickformat=",d")
+    )
+    return fig_funnel
+
 st.title("Demo Service Company Dashboard")
 
 # Check if data is loaded
@@ -107,8 +235,7 @@ else:
     col1, col2, col3 = st.columns(3)
     with col1:
         # Get unique months and sort them chronologically
-        unique_months = sorted(attribution_data["YearMonth"].unique(), 
-                             key=lambda x: pd.to_datetime(x, format="%b. %Y"))
+        unique_months = sorted_months(attribution_data)
         # Find May 2024 index if it exists, otherwise use 0
         may_2024_index = unique_months.index("May. 2024") if "May. 2024" in unique_months else 0
         start_month = st.selectbox("Start Month", unique_months, index=may_2024_index)
@@ -118,25 +245,30 @@ else:
         agg_type = st.selectbox("Aggregation", ["Source", "Campaign"], index=0)
     aggregation_type = "source" if agg_type == "Source" else "campaign"
 
+    # Debug output is off by default; every write round-trips the websocket
+    st.sidebar.checkbox("Debug", key="debug", value=os.environ.get("APP_DEBUG") == "1")
+
     # Prepare data
     agg_data, monthly_agg, revenue_by_yearmonth = prepare_data(start_month, end_month, aggregation_type)
 
     # Debug info
-    st.sidebar.write("Data Range Info:")
-    st.sidebar.write(f"Start Month: {start_month}")
-    st.sidebar.write(f"End Month: {end_month}")
-    st.sidebar.write(f"Available Months: {unique_months}")
+    if st.session_state.get("debug"):
+        st.sidebar.write("Data Range Info:")
+        st.sidebar.write(f"Start Month: {start_month}")
+        st.sidebar.write(f"End Month: {end_month}")
+        st.sidebar.write(f"Available Months: {unique_months}")
 
     # Key Metrics
     st.header("Key Metrics")
     if not agg_data.empty:
-        # Calculate total metrics
+        # Calculate total metrics in one reduction over agg_data
+        totals = agg_data[["Inquiries", "Pricing Sent", "Orders", "Paid Orders", "Campaign Cost"]].sum()
         total_revenue = revenue_by_yearmonth["Order Total"].sum()
-        total_inquiries = agg_data["Inquiries"].sum()
+        total_inquiries = totals["Inquiries"]
         total_orders = monthly_agg["Total Orders"].sum()  # Use the total orders from monthly_agg
-        total_pricing_sent = agg_data["Pricing Sent"].sum()
-        total_attributed_orders = agg_data["Orders"].sum()  # Get attributed orders
-        avg_cost_per_lead = (agg_data["Campaign Cost"].sum() / total_inquiries).round(0)
+        total_pricing_sent = totals["Pricing Sent"]
+        total_attributed_orders = totals["Orders"]  # Get attributed orders
+        avg_cost_per_lead = (totals["Campaign Cost"] / total_inquiries).round(0)
         conversion_rate = ((total_attributed_orders / total_pricing_sent) * 100).round(1)  # Use attributed orders
         booking_rate = ((total_pricing_sent / total_inquiries) * 100).round(1)
         
@@ -207,29 +339,8 @@ else:
     # Monthly Revenue Trend
     st.header("Monthly Revenue Trend")
     if not revenue_by_yearmonth.empty:
-        # Sort the data chronologically
-        revenue_by_yearmonth = revenue_by_yearmonth.sort_values(
-            "YearMonth", 
-            key=lambda x: pd.to_datetime(x, format="%b. %Y")
-        )
-        
-        # Create revenue trend line chart using Plotly
-        fig_trend = go.Figure(data=[go.Scatter(
-            x=revenue_by_yearmonth["YearMonth"],
-            y=revenue_by_yearmonth["Order Total"],
-            mode='lines+markers+text',
-            text=revenue_by_yearmonth["Order Total"].apply(lambda x: f"${int(x):,}"),
-            textposition="top center",
-        )])
-        fig_trend.update_layout(
-            title="Monthly Revenue Trend",
-            height=400,
-            showlegend=False,
-            yaxis_title="Revenue ($)",
-            yaxis=dict(tickformat="$,.0f"),
-            xaxis_title="Month"
-        )
-        st.plotly_chart(fig_trend, use_container_width=True)
+        # Already sorted chronologically by prepare_data
+        st.plotly_chart(make_trend_fig(revenue_by_yearmonth), use_container_width=True, config=PLOTLY_CONFIG)
     else:
         st.warning("No revenue trend data to display.")
 
@@ -239,70 +350,22 @@ else:
 
     with col1:
         if not agg_data.empty:
-            # Create a single pie chart for sources/campaigns
-            fig_sources = go.Figure(data=[go.Pie(
-                labels=agg_data["Display Source"],
-                values=agg_data["Inquiries"],
-                hole=.3,
-                textinfo='label+percent+value',
-                marker=dict(colors=px.colors.qualitative.Set3)
-            )])
-            fig_sources.update_layout(
-                title="Inquiries by Source/Campaign",
-                height=400,
-                showlegend=False
-            )
-            st.plotly_chart(fig_sources, use_container_width=True)
+            # Single pie chart for sources/campaigns
+            st.plotly_chart(make_sources_fig(agg_data), use_container_width=True, config=PLOTLY_CONFIG)
         else:
             st.warning("No attribution data to display.")
 
     with col2:
         if not agg_data.empty:
-            # Create horizontal bar chart for funnel progression
-            # Calculate total values for each stage
-            total_inquiries = agg_data["Inquiries"].sum()
-            total_pricing = agg_data["Pricing Sent"].sum()
-            total_orders = agg_data["Orders"].sum()
-            total_paid = agg_data["Paid Orders"].sum()
-            
-            # Create the funnel data
-            stages = ["Inquiries", "Pricing Sent", "Orders", "Paid Orders"]
-            values = [total_inquiries, total_pricing, total_orders, total_paid]
-            
-            # Calculate percentages
-            percentages = [(v / total_inquiries * 100).round(1) for v in values]
-            
-            # Create the horizontal bar chart
-            fig_funnel = go.Figure(go.Bar(
-                x=values,
-                y=stages,
-                orientation='h',
-                text=[f"{v:,} ({p}%)" for v, p in zip(values, percentages)],
-                textposition='auto',
-                marker_color=px.colors.qualitative.Set3[0]
-            ))
-            
-            fig_funnel.update_layout(
-                title="Marketing Funnel Progression",
-                height=400,
-                showlegend=False,
-                xaxis_title="Count",
-                yaxis_title="Stage",
-                xaxis=dict(tickformat=",d")
-            )
-            
-            st.plotly_chart(fig_funnel, use_container_width=True)
+            # Horizontal bar chart for funnel progression
+            st.plotly_chart(make_funnel_fig(agg_data), use_container_width=True, config=PLOTLY_CONFIG)
         else:
             st.warning("No funnel data to display.")
 
     # Monthly Summary
     st.header("Monthly Summary")
     if not monthly_agg.empty:
-        # Sort the data chronologically
-        monthly_agg = monthly_agg.sort_values(
-            "YearMonth", 
-            key=lambda x: pd.to_datetime(x, format="%b. %Y")
-        )
+        # Already sorted chronologically by prepare_data
         st.dataframe(format_table_data(monthly_agg), use_container_width=True)
     else:
         st.warning("No monthly data to display.")
@@ -341,6 +404,7 @@ else:
             
             # Update layout
             fig_inq_orders.update_layout(
+                **TRIM_LAYOUT,
                 title=f'Inquiries and Orders by {agg_type}',
                 xaxis_tickangle=-45,
                 barmode='group',
@@ -349,7 +413,7 @@ else:
                 xaxis_title=agg_type
             )
             
-            st.plotly_chart(fig_inq_orders, use_container_width=True)
+            st.plotly_chart(fig_inq_orders, use_container_width=True, config=PLOTLY_CONFIG)
 
         with tab2:
             # Bar chart for Revenue and Costs
@@ -373,6 +437,7 @@ else:
             
             # Update layout
             fig_rev_cost.update_layout(
+                **TRIM_LAYOUT,
                 title=f'Revenue and Campaign Costs by {agg_type}',
                 xaxis_tickangle=-45,
                 barmode='group',
@@ -382,7 +447,7 @@ else:
                 yaxis=dict(tickformat="$,")
             )
             
-            st.plotly_chart(fig_rev_cost, use_container_width=True)
+            st.plotly_chart(fig_rev_cost, use_container_width=True, config=PLOTLY_CONFIG)
 
         with tab3:
             # Create conversion metrics visualization
@@ -416,6 +481,7 @@ else:
             
             # Update layout
             fig_conv.update_layout(
+                **TRIM_LAYOUT,
                 title=f'Conversion Metrics by {agg_type}',
                 xaxis_tickangle=-45,
                 height=500,
@@ -425,7 +491,7 @@ else:
                 showlegend=True
             )
             
-            st.plotly_chart(fig_conv, use_container_width=True)
+            st.plotly_chart(fig_conv, use_container_width=True, config=PLOTLY_CONFIG)
     else:
         st.warning("No summary data to display.")
 
@@ -1,114 +1,198 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import streamlit as st
-import json
-import os
-
-print("\n=== Starting Data Processing Pipeline ===\n")
 
 # Google Sheets API setup
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
 
-# Try to get credentials from Streamlit secrets first (deployed environment)
-try:
-    if 'gcp_service_account' in st.secrets:
-        creds_dict = dict(st.secrets['gcp_service_account'])
-        # Convert private key from string to proper format
-        if isinstance(creds_dict['private_key'], str):
-            creds_dict['private_key'] = creds_dict['private_key'].replace('\\n', '\n')
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-    else:
-        # Fallback to local creds.json (development environment)
-        creds = ServiceAccountCredentials.from_json_keyfile_name("creds.json", scope)
-except Exception as e:
-    print(f"Error loading credentials: {e}")
-    raise
-
-client = gspread.authorize(creds)
-
-# Fetch Attribution Data
-print("Fetching attribution_data...")
-sheet = client.open("Demo Data, StatSync").worksheet("attribution_data")
-attribution_data = pd.DataFrame(sheet.get_all_records())
-print(f"✓ Retrieved {len(attribution_data)} rows from attribution_data")
-print("Sample Time Period values before parsing:", attribution_data["Time Period"].head().tolist())
-print("Time Period range before parsing:", attribution_data["Time Period"].min(), "to", attribution_data["Time Period"].max())
-
-# Parse Time Period with mixed formats
-attribution_data["Time Period"] = pd.to_datetime(attribution_data["Time Period"], format="mixed", errors="coerce")
-print("Sample Time Period values after parsing:", attribution_data["Time Period"].head().tolist())
-print("Time Period range after parsing:", attribution_data["Time Period"].min(), "to", attribution_data["Time Period"].max())
-print("Number of null values after parsing:", attribution_data["Time Period"].isna().sum())
-
-attribution_data["Month"] = attribution_data["Time Period"].dt.strftime("%B")
-attribution_data["YearMonth"] = attribution_data["Time Period"].dt.strftime("%b. %Y")
-print("YearMonth range:", attribution_data["YearMonth"].min(), "to", attribution_data["YearMonth"].max())
-print("Unique YearMonths:", sorted(attribution_data["YearMonth"].unique()))
-numeric_cols = ["Inquiries", "Pricing Sent", "Orders", "Paid Orders", "Total Job Amount", "Campaign Cost", "Cost per Closed Sale"]
-attribution_data[numeric_cols] = attribution_data[numeric_cols].apply(pd.to_numeric, errors="coerce").round(0)
-attribution_data["Cost per Lead"] = (attribution_data["Campaign Cost"] / attribution_data["Inquiries"]).replace([float("inf"), -float("inf")], 0).fillna(0).round(0)
-attribution_data["ROI_numeric"] = ((attribution_data["Total Job Amount"] - attribution_data["Campaign Cost"]) / 
-                                   attribution_data["Campaign Cost"]).replace([float("inf"), -float("inf")], 0).fillna(0).round(2)
-attribution_data["ROI"] = attribution_data["ROI_numeric"].apply(lambda x: f"{int(x * 100)}%")
-attribution_data["Display Source"] = attribution_data.apply(
-    lambda row: row["Source"] if row["Campaign Name"] == "N/A" else row["Campaign Name"], axis=1)
-
-# Fetch Orders Data
-print("\nFetching orders_data...")
-orders_sheet = client.open("Demo Data, StatSync").worksheet("orders_data")
-orders_data = pd.DataFrame(orders_sheet.get_all_records())
-print(f"✓ Retrieved {len(orders_data)} rows from orders_data")
-print("Sample timeslot datetime values before parsing:", orders_data["timeslot datetime"].head().tolist())
-
-# Parse timeslot datetime with mixed formats
-orders_data["timeslot datetime"] = pd.to_datetime(orders_data["timeslot datetime"], format="mixed", errors="coerce")
-print("Sample timeslot datetime values after parsing:", orders_data["timeslot datetime"].head().tolist())
-print("Number of null values after parsing:", orders_data["timeslot datetime"].isna().sum())
-
-orders_data["Month"] = orders_data["timeslot datetime"].dt.strftime("%B")
-orders_data["YearMonth"] = orders_data["timeslot datetime"].dt.strftime("%b. %Y")
-orders_data[["Services price", "discount amount"]] = orders_data[["Services price", "discount amount"]].apply(pd.to_numeric, errors="coerce").fillna(0)
-orders_data["Order Total"] = (orders_data["Services price"] - orders_data["discount amount"]).round(0)
-orders_data = orders_data[orders_data["status"] != "CANCELLED"]
-orders_data = orders_data[orders_data["timeslot datetime"].dt.year >= 2020]
-
-# After processing orders data
-print("\nOrders Data Date Range:")
-print("Orders date range:", orders_data["timeslot datetime"].min(), "to", orders_data["timeslot datetime"].max())
-print("Orders YearMonth range:", orders_data["YearMonth"].min(), "to", orders_data["YearMonth"].max())
-print("Unique Orders YearMonths:", sorted(orders_data["YearMonth"].unique()))
-
-# Fetch Notifications Data
-print("\nFetching notifications_data...")
-notifications_sheet = client.open("Demo Data, StatSync").worksheet("notifications_data")
-notifications_data = pd.DataFrame(notifications_sheet.get_all_records())
-print(f"✓ Retrieved {len(notifications_data)} rows from notifications_data")
-print("Sample datetime sent values before parsing:", notifications_data["datetime sent"].head().tolist())
-
-# Parse datetime sent with mixed formats
-notifications_data["datetime sent"] = pd.to_datetime(notifications_data["datetime sent"], format="mixed", errors="coerce")
-print("Sample datetime sent values after parsing:", notifications_data["datetime sent"].head().tolist())
-print("Number of null values after parsing:", notifications_data["datetime sent"].isna().sum())
-
-notifications_data["YearMonth"] = notifications_data["datetime sent"].dt.strftime("%b. %Y")
-# Filter for relevant notification events
-notifications_data = notifications_data[notifications_data["Notification event"].isin(["send_dashboard", "estimates_sent"])]
-# Remove duplicates based on customer id within each month
-notifications_data = notifications_data.drop_duplicates(subset=["Customer id", "YearMonth"])
-# Group by YearMonth to get unique Pricing Sent counts
-pricing_sent_data = notifications_data.groupby("YearMonth").size().reset_index(name="Pricing Sent")
-
-# After processing notifications data
-print("\nNotifications Data Date Range:")
-print("Notifications date range:", notifications_data["datetime sent"].min(), "to", notifications_data["datetime sent"].max())
-print("Notifications YearMonth range:", notifications_data["YearMonth"].min(), "to", notifications_data["YearMonth"].max())
-print("Unique Notifications YearMonths:", sorted(notifications_data["YearMonth"].unique()))
-
-print("\n=== Data Processing Summary ===")
-print("Attribution Data Shape:", attribution_data.shape)
-print("Orders Data Shape:", orders_data.shape)
-print("Notifications Data Shape:", notifications_data.shape)
-print("Pricing Sent Data Shape:", pricing_sent_data.shape)
-
-print("\n=== Data Processing Complete ===\n")
\ No newline at end of file
+# Debug prints walk/sort full columns, so keep them off the hot path by default
+DEBUG = os.environ.get("APP_DEBUG") == "1"
+
+
+def safe_ratio(num, den, decimals):
+    """Element-wise num/den with 0 wherever den == 0, computed in a single
+    fused pass instead of divide + replace(inf) + fillna temporaries."""
+    num = np.asarray(num, dtype="float32")
+    den = np.asarray(den, dtype="float32")
+    out = np.zeros_like(num)
+    np.divide(num, den, out=out, where=den != 0)
+    return out.round(decimals)
+
+
+def _parse_datetimes(s, fmt):
+    """Parse with the expected format in one vectorized pass, then push only
+    the residual rows through the slow per-row format="mixed" path."""
+    parsed = pd.to_datetime(s, format=fmt, errors="coerce")
+    mask = parsed.isna()
+    if mask.any():
+        parsed.loc[mask] = pd.to_datetime(s[mask], format="mixed", errors="coerce")
+    return parsed
+
+
+@st.cache_resource
+def get_client():
+    """Authorize the gspread client once and reuse it across reruns."""
+    # Try to get credentials from Streamlit secrets first (deployed environment)
+    try:
+        if 'gcp_service_account' in st.secrets:
+            creds_dict = dict(st.secrets['gcp_service_account'])
+            # Convert private key from string to proper format
+            if isinstance(creds_dict['private_key'], str):
+                creds_dict['private_key'] = creds_dict['private_key'].replace('\\n', '\n')
+            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+        else:
+            # Fallback to local creds.json (development environment)
+            creds = ServiceAccountCredentials.from_json_keyfile_name("creds.json", scope)
+    except Exception as e:
+        print(f"Error loading credentials: {e}")
+        raise
+    return gspread.authorize(creds)
+
+
+def _worksheet_frame(sheet):
+    """Fetch a worksheet in one values call and build the DataFrame directly,
+    skipping get_all_records()'s per-row dict construction."""
+    rows = sheet.get_all_values()
+    return pd.DataFrame(rows[1:], columns=rows[0])
+
+
+@st.cache_data(ttl=3600)
+def fetch_sheets():
+    """Fetch all three worksheets concurrently; the gspread calls are I/O-bound."""
+    book = get_client().open("Demo Data, StatSync")
+    names = ["attribution_data", "orders_data", "notifications_data"]
+    with ThreadPoolExecutor(max_workers=len(names)) as pool:
+        frames = pool.map(lambda name: _worksheet_frame(book.worksheet(name)), names)
+    return dict(zip(names, frames))
+
+
+@st.cache_data(ttl=3600)
+def load_attribution():
+    """Fetch and clean the attribution worksheet, cached across reruns."""
+    attribution_data = fetch_sheets()["attribution_data"]
+    if DEBUG:
+        print(f"✓ Retrieved {len(attribution_data)} rows from attribution_data")
+        print("Sample Time Period values before parsing:", attribution_data["Time Period"].head().tolist())
+        print("Time Period range before parsing:", attribution_data["Time Period"].min(), "to", attribution_data["Time Period"].max())
+
+    # Parse Time Period; expected format first, mixed fallback for stragglers
+    attribution_data["Time Period"] = _parse_datetimes(attribution_data["Time Period"], "%b. %Y")
+    if DEBUG:
+        print("Sample Time Period values after parsing:", attribution_data["Time Period"].head().tolist())
+        print("Time Period range after parsing:", attribution_data["Time Period"].min(), "to", attribution_data["Time Period"].max())
+        print("Number of null values after parsing:", attribution_data["Time Period"].isna().sum())
+
+    attribution_data["YearMonth"] = attribution_data["Time Period"].dt.strftime("%b. %Y")
+    # Sortable month key, parsed once here so app.py never re-parses the display string
+    attribution_data["YearMonthPeriod"] = attribution_data["Time Period"].dt.to_period("M")
+    if DEBUG:
+        print("YearMonth range:", attribution_data["YearMonth"].min(), "to", attribution_data["YearMonth"].max())
+        print("Unique YearMonths:", sorted(attribution_data["YearMonth"].unique()))
+    numeric_cols = ["Inquiries", "Pricing Sent", "Orders", "Paid Orders", "Total Job Amount", "Campaign Cost"]
+    # Fast path: one bulk astype when every cell is clean; the per-column
+    # to_numeric fallback only pays the per-element parse when stray strings exist
+    try:
+        attribution_data[numeric_cols] = attribution_data[numeric_cols].astype("float32")
+    except (ValueError, TypeError):
+        for c in numeric_cols:
+            attribution_data[c] = pd.to_numeric(attribution_data[c], errors="coerce").astype("float32")
+    # Counts fit int32 and dollar amounts stay exact in float32 (< 2^24); halves the
+    # bytes moved by every downstream groupby scan vs the default int64/float64
+    attribution_data[numeric_cols] = attribution_data[numeric_cols].round(0).fillna(0).astype(
+        {"Inquiries": "int32", "Pricing Sent": "int32", "Orders": "int32", "Paid Orders": "int32",
+         "Total Job Amount": "float32", "Campaign Cost": "float32"})
+    attribution_data["Display Source"] = np.where(attribution_data["Campaign Name"].to_numpy() == "N/A",
+                                                  attribution_data["Source"].to_numpy(),
+                                                  attribution_data["Campaign Name"].to_numpy())
+    # Low-cardinality keys: integer category codes groupby/isin much faster than str objects
+    for c in ["Source", "Campaign Name", "Display Source"]:
+        attribution_data[c] = attribution_data[c].astype("category")
+    # Remaining string column on contiguous Arrow buffers instead of Python objects
+    attribution_data["YearMonth"] = attribution_data["YearMonth"].astype("string[pyarrow]")
+    # Keep only what prepare_data consumes: narrower rows mean fewer bytes per
+    # groupby scan. Per-row Cost per Lead/ROI are recomputed on the aggregates.
+    attribution_data = attribution_data[["YearMonth", "YearMonthPeriod", "Source", "Display Source",
+                                         "Inquiries", "Pricing Sent", "Orders", "Paid Orders",
+                                         "Total Job Amount", "Campaign Cost"]]
+    return attribution_data
+
+
+@st.cache_data(ttl=3600)
+def load_orders():
+    """Fetch and clean the orders worksheet, cached across reruns."""
+    orders_data = fetch_sheets()["orders_data"]
+    if DEBUG:
+        print(f"✓ Retrieved {len(orders_data)} rows from orders_data")
+        print("Sample timeslot datetime values before parsing:", orders_data["timeslot datetime"].head().tolist())
+
+    # Drop cancelled rows first (cheap string compare) so the expensive datetime
+    # parse only runs over rows we keep
+    orders_data = orders_data[orders_data["status"] != "CANCELLED"]
+
+    # Parse timeslot datetime; ISO fast path first, mixed fallback for stragglers
+    orders_data["timeslot datetime"] = _parse_datetimes(orders_data["timeslot datetime"], "ISO8601")
+    if DEBUG:
+        print("Sample timeslot datetime values after parsing:", orders_data["timeslot datetime"].head().tolist())
+        print("Number of null values after parsing:", orders_data["timeslot datetime"].isna().sum())
+
+    orders_data["Month"] = orders_data["timeslot datetime"].dt.strftime("%B")
+    orders_data["YearMonth"] = orders_data["timeslot datetime"].dt.strftime("%b. %Y")
+    orders_data["YearMonthPeriod"] = orders_data["timeslot datetime"].dt.to_period("M")
+    price_cols = ["Services price", "discount amount"]
+    try:
+        orders_data[price_cols] = orders_data[price_cols].astype("float32")
+    except (ValueError, TypeError):
+        for c in price_cols:
+            orders_data[c] = pd.to_numeric(orders_data[c], errors="coerce").astype("float32")
+    orders_data[price_cols] = orders_data[price_cols].fillna(0)
+    orders_data["Order Total"] = (orders_data["Services price"] - orders_data["discount amount"]).round(0)
+    orders_data = orders_data[orders_data["timeslot datetime"].dt.year >= 2020]
+    orders_data["status"] = orders_data["status"].astype("category")
+    for c in ["Month", "YearMonth"]:
+        orders_data[c] = orders_data[c].astype("string[pyarrow]")
+
+    # After processing orders data
+    if DEBUG:
+        print("\nOrders Data Date Range:")
+        print("Orders date range:", orders_data["timeslot datetime"].min(), "to", orders_data["timeslot datetime"].max())
+        print("Orders YearMonth range:", orders_data["YearMonth"].min(), "to", orders_data["YearMonth"].max())
+        print("Unique Orders YearMonths:", sorted(orders_data["YearMonth"].unique()))
+    return orders_data
+
+
+@st.cache_data(ttl=3600)
+def load_pricing_sent():
+    """Fetch the notifications worksheet and derive unique Pricing Sent counts per month."""
+    notifications_data = fetch_sheets()["notifications_data"]
+    if DEBUG:
+        print(f"✓ Retrieved {len(notifications_data)} rows from notifications_data")
+        print("Sample datetime sent values before parsing:", notifications_data["datetime sent"].head().tolist())
+
+    # Parse datetime sent; ISO fast path first, mixed fallback for stragglers
+    notifications_data["datetime sent"] = _parse_datetimes(notifications_data["datetime sent"], "ISO8601")
+    if DEBUG:
+        print("Sample datetime sent values after parsing:", notifications_data["datetime sent"].head().tolist())
+        print("Number of null values after parsing:", notifications_data["datetime sent"].isna().sum())
+
+    notifications_data["YearMonth"] = notifications_data["datetime sent"].dt.strftime("%b. %Y")
+    notifications_data["YearMonthPeriod"] = notifications_data["datetime sent"].dt.to_period("M")
+    # Filter for relevant notification events
+    notifications_data = notifications_data[notifications_data["Notification event"].isin(["send_dashboard", "estimates_sent"])]
+    # Remove duplicates based on customer id within each month
+    notifications_data = notifications_data.drop_duplicates(subset=["Customer id", "YearMonth"])
+    # Group by YearMonthPeriod to get unique Pricing Sent counts
+    pricing_sent_data = notifications_data.groupby("YearMonthPeriod").size().reset_index(name="Pricing Sent")
+    pricing_sent_data["YearMonth"] = pricing_sent_data["YearMonthPeriod"].dt.strftime("%b. %Y").astype("string[pyarrow]")
+
+    # After processing notifications data
+    if DEBUG:
+        print("\nNotifications Data Date Range:")
+        print("Notifications date range:", notifications_data["datetime sent"].min(), "to", notifications_data["datetime sent"].max())
+        print("Notifications YearMonth range:", notifications_data["YearMonth"].min(), "to", notifications_data["YearMonth"].max())
+        print("Unique Notifications YearMonths:", sorted(notifications_data["YearMonth"].unique()))
+    return pricing_sent_data